@@ -1,9 +1,9 @@
 import argparse
 import json
-from os.path import exists
-from csv import DictReader, QUOTE_MINIMAL
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-from typing import List, Dict, Any
+from typing import FrozenSet, List, Dict, Any
 
 
 # setting csv field size limit to the biggest value allowed
@@ -13,6 +13,24 @@ import csv
 C_LONG_MAX = 2147483647
 csv.field_size_limit(C_LONG_MAX)
 
+# the columns in dokumentcdw.csv that belong to the "cdw" part of a row
+# everything else belongs to the "dokument" part
+# (a frozenset, so membership tests are a single hash probe)
+CDW_KEYS: FrozenSet[str] = frozenset(
+    {
+        "cdw_id",
+        "cdwDocumentUniqueID",
+        "cdwCreatedDate",
+        "From1",
+        "PostedDate",
+        "SendTo",
+        "CopyTo",
+        "BlindCopyTo",
+        "Subject",
+        "cdwBody",
+    }
+)
+
 
 def cirius(folder: str) -> None:
     """
@@ -21,16 +39,17 @@ def cirius(folder: str) -> None:
     * Produces a .json file with all the info neatly organized
     """
     # specifiying the files we need and checking that they exist
-    csv_fil = folder + r"\fil.csv"
-    csv_sag = folder + r"\sag.csv"
-    csv_dokumentcdw = folder + r"\dokumentcdw.csv"
-    csv_notat = folder + r"\notat.csv"
-
-    if not (
-        exists(csv_fil)
-        and exists(csv_sag)
-        and exists(csv_dokumentcdw)
-        and exists(csv_notat)
+    # (pathlib joins with the right separator on any OS,
+    # instead of the old hardcoded Windows backslashes)
+    folder_path = Path(folder)
+    csv_fil = folder_path / "fil.csv"
+    csv_sag = folder_path / "sag.csv"
+    csv_dokumentcdw = folder_path / "dokumentcdw.csv"
+    csv_notat = folder_path / "notat.csv"
+
+    if not all(
+        path.exists()
+        for path in (csv_fil, csv_sag, csv_dokumentcdw, csv_notat)
     ):
         raise Exception(
             "Required .csv files weren't found in the specified directory"
@@ -46,184 +65,224 @@ def cirius(folder: str) -> None:
     dokumentFiles: Dict[str, List[Dict[str, str]]] = dict()
     cdwFiles: Dict[str, List[Dict[str, str]]] = dict()
     notatFiles: Dict[str, List[Dict[str, str]]] = dict()
-    # ... and also we're gonna make a mapping between these and the
-    # names used in fil.csv to specify which object it belongs to
-    dict_mapping = {
-        "dokument": dokumentFiles,
-        "cdw": cdwFiles,
-        "notat": notatFiles,
+    # ... and also we're gonna make a mapping between the names used
+    # in fil.csv and each dict's pre-bound setdefault method
+    # this way the hot loop below does one dict lookup and one call
+    # per row, with no attribute lookup in between
+    group_fil = {
+        "dokument": dokumentFiles.setdefault,
+        "cdw": cdwFiles.setdefault,
+        "notat": notatFiles.setdefault,
     }
 
-    # then we're gonna read thru fil.csv using DictReader,
-    # saving us the trouble of making each file into a dict ourselves
-    with open(csv_fil, newline="", encoding="utf-8") as csv:
-        reader = DictReader(csv, delimiter=";", quotechar='"')
-        for fil in reader:
+    # fil.csv, sag.csv and notat.csv don't depend on each other,
+    # so we can read all three in parallel worker threads
+    # (the interpreter lock is released while waiting on disk I/O,
+    # so the reads genuinely overlap)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        future_fil = executor.submit(_read_csv_rows, csv_fil)
+        future_sag = executor.submit(_read_csv_rows, csv_sag)
+        future_notat = executor.submit(_read_csv_rows, csv_notat)
+
+        # then we're gonna go thru the fil.csv rows,
+        # that _read_csv_rows already made into dicts for us
+        # (only waiting for fil.csv here, so the grouping below
+        # overlaps the sag/notat reads still going in the workers)
+        for fil in future_fil.result():
             # for each file, we're gonna check what kind of object it belongs to
             # and put it inside the appropriate dict, using the object's id as the key
             # so we can easily find it later
-            appropriate_dict = dict_mapping[fil["notes_template_name"]]
-            if fil["notes_template_id"] not in appropriate_dict:
-                appropriate_dict[fil["notes_template_id"]] = []
             # we're using a list to keep the files, since a single
-            # object can have multiple files attached to it
-            appropriate_dict[fil["notes_template_id"]].append(fil)
+            # object can have multiple files attached to it,
+            # and setdefault gives us the "create the list if it's missing"
+            # behaviour in a single dict lookup
+            group_fil[fil["notes_template_name"]](
+                fil["notes_template_id"], []
+            ).append(fil)
+
+        # dokumentcdw.csv couldn't go in the pool, since processing it
+        # depends on the grouping we just did; reading it here in the
+        # main thread still overlaps whatever the workers have left
+        dokumentcdw_rows = _read_csv_rows(csv_dokumentcdw)
 
     # now that we've got that handled, we can move on to the
     # outermost "layer" of our .json - sag.csv
-    # Since our "sager" need to be in a list, we're gonna make a dict
-    # to map our key value, "SagsNr", to the index of that "sag" in our list
-    sager: List[Dict[str, Any]] = []
-    index_mapping_sager: Dict[str, int] = dict()
-
-    with open(csv_sag, newline="", encoding="utf-8") as csv:
-        reader = DictReader(csv, delimiter=";", quotechar='"')
-        for sag in reader:
-            sager.append(sag)
-            index_mapping_sager[sag["SagsNr"]] = len(sager) - 1
-
-    # we need ANOTHER list and dict,
+    # we keep the "sager" in a dict keyed by "SagsNr",
+    # so finding a "sag" later is a single lookup
+    # (dicts remember insertion order, so the .csv row order is
+    # preserved when we write the output at the end)
+    # building it in one comprehension keeps the whole load in a
+    # single tight loop, with no repeated name lookups per row
+    sager: Dict[str, Dict[str, Any]] = {
+        sag["SagsNr"]: sag for sag in future_sag.result()
+    }
+
+    # we need ANOTHER dict like that,
     # in order to keep track of "dokumenter"
     # while also properly handling "cdwer"
-    dokumenter: List[Dict[str, Any]] = []
-    index_mapping_dokumenter: Dict[str, int] = dict()
-
-    # and also, for convenience, I'm gonna define specific helper methods here,
-    # cutting down on the amount of parameters I need to
-    # provide when wanting to append objects later.
-    def append_to_sag(sagsNr: str, obj_type: str, obj: Dict[str, Any]):
-        append_to_obj(sager, index_mapping_sager, sagsNr, obj_type, obj)
-
-    def append_to_dokument(dokId: str, obj: Dict[str, Any]):
-        append_to_obj(
-            dokumenter, index_mapping_dokumenter, dokId, "cdwListe", obj
-        )
+    dokumenter: Dict[str, Dict[str, Any]] = dict()
 
     # now we can start processing "dokumentcdw.csv"
-    with open(csv_dokumentcdw, newline="", encoding="utf-8") as csv:
-        reader = DictReader(
-            csv, delimiter=";", quotechar='"', quoting=QUOTE_MINIMAL
-        )
-        for dokumentcdw in reader:
-            # split "dokumentcdw" into "dokument" and "cdw"
-            dokument: Dict[str, Any] = dict()
-            cdw: Dict[str, Any] = dict()
-            # all the info cdw has
-            # the rest is for dokument
-            cdw_keys = [
-                "cdw_id",
-                "cdwDocumentUniqueID",
-                "cdwCreatedDate",
-                "From1",
-                "PostedDate",
-                "SendTo",
-                "CopyTo",
-                "BlindCopyTo",
-                "Subject",
-                "cdwBody",
-            ]
-            # now we can iterate thru all the values in our dokumentcdw dict
-            # and copy them into the appropriate dict
-            for key, value in dokumentcdw.items():
-                if value is None:
-                    value = ""
-                if key in cdw_keys:
-                    cdw[key] = value
-                else:
-                    dokument[key] = value
-
-            # check if dokument is already in our dict
-            # if not, we'll process it
-            # otherwise we've already seen this dokument before
-            # so this information is already known to us
-            if dokument["dokument_id"] not in dokumenter:
-                # add filListe to dokument,
-                # if it has any
-                if dokument["dokument_id"] in dokumentFiles:
-                    dokument["filListe"] = dokumentFiles[
-                        dokument["dokument_id"]
-                    ]
-
-                # append dokument to "dokumenter"
-                # and also, update "index_mapping_dokumenter"
-                # similarly to what we did with "sager" earlier
-                dokumenter.append(dokument)
-                index_mapping_dokumenter[dokument["dokument_id"]] = (
-                    len(dokumenter) - 1
-                )
-
-            # now start processing the cdw portion!
-            # check if there IS any cdw info at all,
-            # 'cus a dokument might not have any
-            if cdw["cdw_id"] != "":
-                # add filListe to cdw
-                if cdw["cdw_id"] in cdwFiles:
-                    cdw["filListe"] = cdwFiles[cdw["cdw_id"]]
-
-                # append cdw to the corresponding dokument,
-                append_to_dokument(dokumentcdw["dokument_id"], cdw)
+    for dokumentcdw in dokumentcdw_rows:
+        # split "dokumentcdw" into "dokument" and "cdw"
+        # (CDW_KEYS up top tells us which columns belong to cdw)
+        # the two comprehensions run the whole partition at C level,
+        # and _read_csv_rows guarantees every column is a str,
+        # so no per-field None guard is needed anymore
+        cdw: Dict[str, Any] = {
+            k: v for k, v in dokumentcdw.items() if k in CDW_KEYS
+        }
+        dokument: Dict[str, Any] = {
+            k: v for k, v in dokumentcdw.items() if k not in CDW_KEYS
+        }
+
+        # check if dokument is already in our dict
+        # if not, we'll process it
+        # otherwise we've already seen this dokument before
+        # so this information is already known to us
+        if dokument["dokument_id"] not in dokumenter:
+            # add dokument to "dokumenter",
+            # keyed by its id similarly to "sager" earlier
+            dokumenter[dokument["dokument_id"]] = dokument
+
+        # now start processing the cdw portion!
+        # check if there IS any cdw info at all,
+        # 'cus a dokument might not have any
+        if cdw["cdw_id"] != "":
+            # append cdw to the corresponding dokument
+            # (which is guaranteed to exist at this point,
+            # since we just added it above if it was new)
+            dokumenter[dokument["dokument_id"]].setdefault(
+                "cdwListe", []
+            ).append(cdw)
+
+    # with the dokumenter and cdwer deduplicated and in place,
+    # we attach their files in one pass over the finished structure,
+    # instead of doing the lookups inside the hot parsing loop above
+    for dokument in dokumenter.values():
+        fil_liste = dokumentFiles.get(dokument["dokument_id"])
+        if fil_liste is not None:
+            dokument["filListe"] = fil_liste
+        for cdw in dokument.get("cdwListe", ()):
+            fil_liste = cdwFiles.get(cdw["cdw_id"])
+            if fil_liste is not None:
+                cdw["filListe"] = fil_liste
 
     # add all dokumenter to their respecticve sager
-    for dokument in dokumenter:
+    # setdefault creates the "dokumentListe" on the sag if it's missing
+    for dokument in dokumenter.values():
         sagsnr = dokument["SagsNr"]
-        append_to_sag(sagsnr, "dokumentListe", dokument)
-
-    with open(csv_notat, newline="", encoding="utf-8") as csv:
-        reader = DictReader(csv, delimiter=";", quotechar='"')
-        for notat in reader:
-            # before we add the "notat" to our "sag",
-            # we're gonna check if the "notat" has any files
-            # If it does, we add the list to this "notat"
-            if notat["notat_id"] in notatFiles:
-                notat["filListe"] = notatFiles[notat["notat_id"]]
-
-            # and we're also gonna check if our "sag" has a list of "notater"
-            # we can append to; if not, we create one
-            sagsnr = notat["SagsNr"]
-            append_to_sag(sagsnr, "notatListe", notat)
-
-    # finally, we can encode our list of "sager" as .json,
-    # and write it to file
-    json_sager = json.JSONEncoder(indent=4).encode(sager)
-    with open(folder + r"\cirius.json", "w") as f:
-        f.write(json_sager)
-
-
-# generic helper method, to cut down on repeated code
-# handles the appending of a "child object" to their corresponding "parent object"
-# (like for example a "dokument" to a "sag")
-def append_to_obj(
-    parent_objects: List[Dict[str, Any]],
-    parent_index_map: Dict[str, int],
-    index_key: str,
-    child_obj_type: str,
-    child_obj: Dict[str, Any],
-) -> None:
-    # find the object that this object needs to be appended to
-    # by checking our index_map with the key,
-    # and then using the result to index into the object list
-    if index_key not in parent_index_map:
-        print(
-            f"ERROR: following object was not found using index {index_key}: \n{child_obj}"
+        if sagsnr not in sager:
+            print(
+                f"ERROR: following object was not found using index {sagsnr}: \n{dokument}"
+            )
+            continue
+        sager[sagsnr].setdefault("dokumentListe", []).append(dokument)
+
+    for notat in future_notat.result():
+        # before we add the "notat" to our "sag",
+        # we're gonna check if the "notat" has any files
+        # If it does, we add the list to this "notat"
+        if notat["notat_id"] in notatFiles:
+            notat["filListe"] = notatFiles[notat["notat_id"]]
+
+        # and then we append the "notat" to its "sag",
+        # with setdefault creating the "notatListe" if it's missing
+        sagsnr = notat["SagsNr"]
+        if sagsnr not in sager:
+            print(
+                f"ERROR: following object was not found using index {sagsnr}: \n{notat}"
+            )
+            continue
+        sager[sagsnr].setdefault("notatListe", []).append(notat)
+
+    # finally, we can encode our "sager" as .json and write it to file
+    # we write the surrounding list ourselves and stream the output
+    # one fully assembled "sag" at a time, so the encoder only ever
+    # works on a single "sag" and we never build a separate list of
+    # all of them just for the encode
+    # each "sag" is emitted compact (no indent) on its own line
+    # pretty-printing made the encoder take a much slower path and
+    # blew up the file size, and the .json is meant for machines anyway
+    # (pipe it thru e.g. "python -m json.tool" if you need to read it)
+    # check_circular is safe to turn off, since the data is a tree
+    # parsed straight from the .csv files, and skipping the
+    # visited-set bookkeeping makes the encode a bit faster
+    encoder = json.JSONEncoder(
+        ensure_ascii=False, separators=(",", ":"), check_circular=False
+    )
+    with open(folder_path / "cirius.json", "w", encoding="utf-8") as f:
+        f.write("[\n")
+        first = True
+        for sag in sager.values():
+            if not first:
+                f.write(",\n")
+            f.writelines(encoder.iterencode(sag))
+            first = False
+        f.write("\n]")
+
+
+# helper method that reads an entire ;-separated .csv file
+# into a list of row dicts in one go
+# we end up keeping all the rows in memory anyway,
+# so materializing the whole file up front costs us nothing extra,
+# and it keeps the parsing in one place so we can swap in a faster
+# parser backend later without touching the processing loops
+def _read_csv_rows(path: Path) -> List[Dict[str, Any]]:
+    # a 1 MiB buffer means far fewer read() syscalls on big files
+    # than the default 8 KiB, which helps a lot on network drives
+    with open(path, newline="", encoding="utf-8", buffering=1 << 20) as f:
+        reader = csv.reader(f, delimiter=";", quotechar='"')
+        # the header row tells us the columns of this file,
+        # and those become the keys of every row dict
+        header = next(reader, None)
+        if header is None:
+            return []
+        # we generate a parser function specialized to this exact
+        # header: a single dict literal with the column names baked in
+        # as constants, so turning a row into a dict involves no
+        # per-row key handling at all, and every row dict points at
+        # the key objects stored once in the generated code object
+        # (repr-ing the names keeps the generated source valid even if
+        # a column name contains quotes or other odd characters)
+        source = (
+            "def _parse_row(row): return {"
+            + ", ".join(
+                f"{column!r}: row[{i}]" for i, column in enumerate(header)
+            )
+            + "}"
         )
-        return
+        namespace: Dict[str, Any] = {}
+        exec(source, namespace)
+        parse_row = namespace["_parse_row"]
+        # rows with fewer fields than the header get padded with ""
+        # before parsing, so every row dict has every column
+        # (the generated parser indexes every column unconditionally)
+        column_count = len(header)
+        return [
+            parse_row(
+                row
+                if len(row) >= column_count
+                else row + [""] * (column_count - len(row))
+            )
+            for row in reader
+        ]
 
-    corresponding_obj = parent_objects[parent_index_map[index_key]]
-    # check if this object has a list to append our object to.
-    # if not, we create one
-    if child_obj_type not in corresponding_obj:
-        corresponding_obj[child_obj_type] = []
-    # finally, we add the object to the list
-    corresponding_obj[child_obj_type].append(child_obj)
 
+# Set up argparse stuff and run the conversion
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "folder",
+        help="the path to the directory where the " + ".csv files are located",
+        type=str,
+    )
+    args: argparse.Namespace = parser.parse_args()
+    cirius(args.folder)
 
-# Set up argparse stuff
 
-parser = argparse.ArgumentParser()
-parser.add_argument(
-    "folder",
-    help="the path to the directory where the " + ".csv files are located",
-    type=str,
-)
-args: argparse.Namespace = parser.parse_args()
-cirius(args.folder)
+# only run the conversion when executed as a script,
+# so importing this module (for tests, profiling, etc.)
+# doesn't kick off the whole pipeline
+if __name__ == "__main__":
+    main()